@@ -1,20 +1,63 @@
 import subprocess
 import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 parser = argparse.ArgumentParser(description="Run benchmark for wasmtime with RR support.")
 parser.add_argument("--rr", type=str, help="Path to RR-supported Wasmtime", required=True)
 parser.add_argument("--upstream", type=str, help="Path to upstream Wasmtime", required=True)
+parser.add_argument("--export-json", type=str, default="hyperfine_results.json", help="File to export hyperfine results to")
+parser.add_argument("--parallel", action="store_true", help="Run each variant in its own hyperfine process concurrently, pinned to separate cores (faster, but noisier timings)")
+parser.add_argument("--min-runs", type=int, default=10, help="Minimum number of runs per variant")
+parser.add_argument("--warmup", type=int, default=1, help="Warmup runs per variant (mostly warms the page cache, which all variants share)")
 
 args = parser.parse_args()
 
-hyperfine = "hyperfine --warmup 3 --shell=none".split(' ')
+hyperfine = "hyperfine --shell=none".split(' ') + ["--warmup", str(args.warmup), "--min-runs", str(args.min_runs)]
 
-program_common = "--dir=data test-modules/wasi/target/wasm32-wasip2/debug/compressor.wasm --input data/uncompressed-10M --output data/compressed.bin"
+variants = [
+    ("wasmtime-rr-record-enabled", [args.rr, "-R path=\"\""]),
+    ("wasmtime-rr-record-disabled", [args.rr]),
+    ("wasmtime-without-rr", [args.upstream]),
+]
 
-subprocess.run(
-        hyperfine 
-        + [f"-n \"{x}\"" for x in ["wasmtime-rr-record-enabled", "wasmtime-rr-record-disabled", "wasmtime-without-rr"]]
-        + [' '.join([args.rr, "-R path=\"\"", program_common])]
-        + [' '.join([args.rr, program_common])]
-        + [' '.join([args.upstream, program_common])]
-)
+def program_common(output):
+    return f"--dir=data test-modules/wasi/target/wasm32-wasip2/debug/compressor.wasm --input data/uncompressed-10M --output data/{output}"
+
+# Concurrent runs must not share an output file
+benchmarks = [
+    (name, ' '.join(prefix + [program_common(f"compressed-{name}.bin" if args.parallel else "compressed.bin")]))
+    for name, prefix in variants
+]
+
+if args.parallel:
+    # One hyperfine per variant, each pinned to its own core to limit cross-contention
+    stem, ext = os.path.splitext(args.export_json)
+    # Only cores this process may run on (respects restricted cpusets)
+    cores = sorted(os.sched_getaffinity(0))
+    if len(cores) < len(benchmarks):
+        sys.exit(f"Error: --parallel needs {len(benchmarks)} usable CPUs, but only {len(cores)} are available")
+
+    def run_pinned(idx):
+        name, cmdstr = benchmarks[idx]
+        return subprocess.run(
+            ["taskset", "-c", str(cores[idx])]
+            + hyperfine
+            + ["--export-json", f"{stem}-{name}{ext}", "-n", name, cmdstr]
+        )
+
+    with ThreadPoolExecutor(max_workers=len(benchmarks)) as ex:
+        procs = list(ex.map(run_pinned, range(len(benchmarks))))
+
+    # A failed variant leaves no export behind, so don't let it pass silently
+    failed = [name for (name, _), proc in zip(benchmarks, procs) if proc.returncode != 0]
+    if failed:
+        sys.exit(f"Error: hyperfine failed for {', '.join(failed)}")
+else:
+    # All commands go through a single hyperfine invocation, each paired with its name
+    cmd = hyperfine + ["--export-json", args.export_json]
+    for name, cmdstr in benchmarks:
+        cmd += ["-n", name, cmdstr]
+
+    subprocess.run(cmd)
@@ -1,13 +1,37 @@
 #!/usr/bin/env python3
 import argparse
-import json
 import sys
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+import matplotlib
+# Plots are only ever written to files, so use the non-interactive raster backend
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-def plot_results(data, output_dir):
-    # Reconstruct all_results map
+# orjson decodes large result files considerably faster when available
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+# Heatmaps with more cells than this are drawn without per-cell value labels
+MAX_ANNOTATED_CELLS = 256
+
+def save_png_async(pool, fig, filename):
+    # Rasterize here (matplotlib is not thread-safe), then hand the pixels to the pool:
+    # PNG compression and the file write release the GIL and overlap with the next plot
+    fig.canvas.draw()
+    pixels = np.asarray(fig.canvas.buffer_rgba()).copy()
+    return pool.submit(lambda: Image.fromarray(pixels).save(filename))
+
+def collect_results(data):
+    # Reconstruct all_results map keyed by (n, d), plus the sorted N and D axes
     all_results = {}
     n_values = set()
     d_values = set()
@@ -19,125 +43,114 @@ def plot_results(data, output_dir):
         d_values.add(d)
         all_results[(n, d)] = entry["results"]
 
+    return all_results, sorted(n_values), sorted(d_values)
+
+def plot_results(data, output_dir):
+    all_results, n_sorted, d_sorted = collect_results(data)
     strategies = ["Uffd", "SoftDirty", "EmulatedSoftDirty"]
+
+    # Pivot into per-strategy series keyed by (strat, d) with X=N and (strat, n) with X=D.
+    # Visiting points in (n, d) order keeps every series sorted along its X axis.
+    def new_series():
+        return {"x": [], "scan_avg": [], "scan_stdev": [], "harness_avg": [], "harness_stdev": []}
+
+    by_d = defaultdict(new_series)
+    by_n = defaultdict(new_series)
+    for (n, d), res_map in sorted(all_results.items()):
+        for strat in strategies:
+            res = res_map.get(strat)
+            if not res:
+                continue
+            for series, x in ((by_d[(strat, d)], n), (by_n[(strat, n)], d)):
+                series["x"].append(x)
+                series["scan_avg"].append(res["scan_avg"])
+                series["scan_stdev"].append(res["scan_stdev"])
+                series["harness_avg"].append(res["harness_avg"])
+                series["harness_stdev"].append(res["harness_stdev"])
     
-    # Plot 1: Fixed D, X=N, Y=Time
-    for d in sorted(d_values):
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-        fig.suptitle(f"Benchmark Results (d={d})")
+    # A single figure is reused for every plot; axes are cleared between saves.
+    # It is built on a bare Agg canvas so pyplot's figure manager is never involved.
+    fig = Figure(figsize=(14, 6))
+    FigureCanvasAgg(fig)
+    ax1, ax2 = fig.subplots(1, 2)
+    saves = []
+    # The pool is shut down (after finishing queued saves) even if drawing fails part way
+    with ThreadPoolExecutor() as pool:
+        # Plot 1: Fixed D, X=N, Y=Time
+        for d in d_sorted:
+            ax1.cla()
+            ax2.cla()
+            fig.suptitle(f"Benchmark Results (d={d})")
         
-        # Plot Scan Time
-        for strat in strategies:
-            x = []
-            y = []
-            yerr = []
-            for n in sorted(n_values):
-                res = all_results.get((n, d), {}).get(strat)
-                if res:
-                    x.append(n)
-                    y.append(res["scan_avg"])
-                    yerr.append(res["scan_stdev"])
-            ax1.errorbar(x, y, yerr=yerr, label=strat, marker='o', capsize=5)
+            # Plot Scan Time
+            for strat in strategies:
+                s = by_d[(strat, d)]
+                ax1.errorbar(s["x"], s["scan_avg"], yerr=s["scan_stdev"], label=strat, marker='o', capsize=5)
         
-        ax1.set_title("Scan Time vs N")
-        ax1.set_xlabel("N (ops)")
-        ax1.set_xscale('log', base=10)
-        ax1.set_ylabel("Time (µs)")
-        ax1.legend()
-        ax1.grid(True, alpha=0.3)
-
-        # Plot Harness Time
-        for strat in strategies:
-            x = []
-            y = []
-            yerr = []
-            for n in sorted(n_values):
-                res = all_results.get((n, d), {}).get(strat)
-                if res:
-                    x.append(n)
-                    y.append(res["harness_avg"])
-                    yerr.append(res["harness_stdev"])
-            ax2.errorbar(x, y, yerr=yerr, label=strat, marker='o', capsize=5)
+            ax1.set_title("Scan Time vs N")
+            ax1.set_xlabel("N (ops)")
+            ax1.set_xscale('log', base=10)
+            ax1.set_ylabel("Time (µs)")
+            ax1.legend()
+            ax1.grid(True, alpha=0.3)
+
+            # Plot Harness Time
+            for strat in strategies:
+                s = by_d[(strat, d)]
+                ax2.errorbar(s["x"], s["harness_avg"], yerr=s["harness_stdev"], label=strat, marker='o', capsize=5)
             
-        ax2.set_title("Harness Time vs N")
-        ax2.set_xlabel("N (ops)")
-        ax2.set_xscale('log', base=10)
-        ax2.set_ylabel("Time (µs)")
-        ax2.legend()
-        ax2.grid(True, alpha=0.3)
+            ax2.set_title("Harness Time vs N")
+            ax2.set_xlabel("N (ops)")
+            ax2.set_xscale('log', base=10)
+            ax2.set_ylabel("Time (µs)")
+            ax2.legend()
+            ax2.grid(True, alpha=0.3)
         
-        plt.tight_layout()
-        filename = os.path.join(output_dir, f"benchmark_d_{d}.png")
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close(fig)
-
-    # Plot 2: Fixed N, X=D, Y=Time
-    for n in sorted(n_values):
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-        fig.suptitle(f"Benchmark Results (n={n})")
+            fig.tight_layout()
+            filename = os.path.join(output_dir, f"benchmark_d_{d}.png")
+            saves.append((filename, save_png_async(pool, fig, filename)))
+
+        # Plot 2: Fixed N, X=D, Y=Time
+        for n in n_sorted:
+            ax1.cla()
+            ax2.cla()
+            fig.suptitle(f"Benchmark Results (n={n})")
         
-        # Plot Scan Time
-        for strat in strategies:
-            x = []
-            y = []
-            yerr = []
-            for d in sorted(d_values):
-                res = all_results.get((n, d), {}).get(strat)
-                if res:
-                    x.append(d)
-                    y.append(res["scan_avg"])
-                    yerr.append(res["scan_stdev"])
-            ax1.errorbar(x, y, yerr=yerr, label=strat, marker='o', capsize=5)
+            # Plot Scan Time
+            for strat in strategies:
+                s = by_n[(strat, n)]
+                ax1.errorbar(s["x"], s["scan_avg"], yerr=s["scan_stdev"], label=strat, marker='o', capsize=5)
         
-        ax1.set_title("Scan Time vs D")
-        ax1.set_xlabel("D (stddev)")
-        ax1.set_xscale('log', base=2)
-        ax1.set_ylabel("Time (µs)")
-        ax1.legend()
-        ax1.grid(True, alpha=0.3)
-
-        # Plot Harness Time
-        for strat in strategies:
-            x = []
-            y = []
-            yerr = []
-            for d in sorted(d_values):
-                res = all_results.get((n, d), {}).get(strat)
-                if res:
-                    x.append(d)
-                    y.append(res["harness_avg"])
-                    yerr.append(res["harness_stdev"])
-            ax2.errorbar(x, y, yerr=yerr, label=strat, marker='o', capsize=5)
+            ax1.set_title("Scan Time vs D")
+            ax1.set_xlabel("D (stddev)")
+            ax1.set_xscale('log', base=2)
+            ax1.set_ylabel("Time (µs)")
+            ax1.legend()
+            ax1.grid(True, alpha=0.3)
+
+            # Plot Harness Time
+            for strat in strategies:
+                s = by_n[(strat, n)]
+                ax2.errorbar(s["x"], s["harness_avg"], yerr=s["harness_stdev"], label=strat, marker='o', capsize=5)
             
-        ax2.set_title("Harness Time vs D")
-        ax2.set_xlabel("D (stddev)")
-        ax2.set_xscale('log', base=2)
-        ax2.set_ylabel("Time (µs)")
-        ax2.legend()
-        ax2.grid(True, alpha=0.3)
+            ax2.set_title("Harness Time vs D")
+            ax2.set_xlabel("D (stddev)")
+            ax2.set_xscale('log', base=2)
+            ax2.set_ylabel("Time (µs)")
+            ax2.legend()
+            ax2.grid(True, alpha=0.3)
         
-        plt.tight_layout()
-        filename = os.path.join(output_dir, f"benchmark_n_{n}.png")
-        plt.savefig(filename)
-        print(f"Saved plot to {filename}")
-        plt.close(fig)
+            fig.tight_layout()
+            filename = os.path.join(output_dir, f"benchmark_n_{n}.png")
+            saves.append((filename, save_png_async(pool, fig, filename)))
 
-def plot_heatmaps(data, output_dir):
-    # Reconstruct all_results map
-    all_results = {}
-    n_values = set()
-    d_values = set()
-    
-    for entry in data:
-        n = entry["n"]
-        d = entry["d"]
-        n_values.add(n)
-        d_values.add(d)
-        all_results[(n, d)] = entry["results"]
+        for filename, future in saves:
+            future.result()
+            print(f"Saved plot to {filename}")
 
-    n_sorted = sorted(n_values)
-    d_sorted = sorted(d_values)
+def compute_speedup_grids(data):
+    # Returns the sorted N/D axes, the four (speedup grid, title) pairs and their shared max
+    all_results, n_sorted, d_sorted = collect_results(data)
     
     # Prepare grids
     # Rows = D, Cols = N
@@ -145,72 +158,83 @@ def plot_heatmaps(data, output_dir):
     cols = len(n_sorted)
     
     # Speedup = Baseline / Target
-    
+    # Gather raw averages into dense grids in a single pass; missing entries stay 0
+    d_to_row = {d: i for i, d in enumerate(d_sorted)}
+    n_to_col = {n: i for i, n in enumerate(n_sorted)}
+    uffd_scan = np.zeros((rows, cols))
+    sd_scan = np.zeros((rows, cols))
+    uffd_harness = np.zeros((rows, cols))
+    sd_harness = np.zeros((rows, cols))
+    esd_harness = np.zeros((rows, cols))
+
+    for (n, d), res in all_results.items():
+        r, c = d_to_row[d], n_to_col[n]
+        uffd = res.get("Uffd")
+        sd = res.get("SoftDirty")
+        esd = res.get("EmulatedSoftDirty")
+        if uffd:
+            uffd_scan[r, c] = uffd["scan_avg"]
+            uffd_harness[r, c] = uffd["harness_avg"]
+        if sd:
+            sd_scan[r, c] = sd["scan_avg"]
+            sd_harness[r, c] = sd["harness_avg"]
+        if esd:
+            esd_harness[r, c] = esd["harness_avg"]
+
+    def speedup(baseline, target):
+        # Cells with no (or zero) target time are left at 0
+        return np.divide(baseline, target, out=np.zeros_like(target), where=target > 0)
+
     # 1. Scan: Uffd vs SoftDirty (Baseline = SoftDirty)
-    scan_speedup_uffd_vs_sd = [[0.0] * cols for _ in range(rows)]
-    
+    scan_speedup_uffd_vs_sd = speedup(sd_scan, uffd_scan)
+
     # 2. Harness: Uffd vs SoftDirty (Baseline = SoftDirty)
-    harness_speedup_uffd_vs_sd = [[0.0] * cols for _ in range(rows)]
-    
+    harness_speedup_uffd_vs_sd = speedup(sd_harness, uffd_harness)
+
     # 3. Harness: Uffd vs ESD (Baseline = ESD)
-    harness_speedup_uffd_vs_esd = [[0.0] * cols for _ in range(rows)]
-    
+    harness_speedup_uffd_vs_esd = speedup(esd_harness, uffd_harness)
+
     # 4. Harness: SoftDirty vs ESD (Baseline = ESD)
-    harness_speedup_sd_vs_esd = [[0.0] * cols for _ in range(rows)]
-    
-    for r, d in enumerate(d_sorted):
-        for c, n in enumerate(n_sorted):
-            res = all_results.get((n, d))
-            if not res:
-                continue
-            
-            esd = res.get("EmulatedSoftDirty")
-            uffd = res.get("Uffd")
-            sd = res.get("SoftDirty")
-            
-            # Uffd vs SoftDirty
-            if uffd and sd:
-                if uffd["scan_avg"] > 0:
-                    scan_speedup_uffd_vs_sd[r][c] = sd["scan_avg"] / uffd["scan_avg"]
-                if uffd["harness_avg"] > 0:
-                    harness_speedup_uffd_vs_sd[r][c] = sd["harness_avg"] / uffd["harness_avg"]
-
-            # Uffd vs ESD
-            if esd and uffd:
-                if uffd["harness_avg"] > 0:
-                    harness_speedup_uffd_vs_esd[r][c] = esd["harness_avg"] / uffd["harness_avg"]
-            
-            # SoftDirty vs ESD
-            if esd and sd:
-                if sd["harness_avg"] > 0:
-                    harness_speedup_sd_vs_esd[r][c] = esd["harness_avg"] / sd["harness_avg"]
+    harness_speedup_sd_vs_esd = speedup(esd_harness, sd_harness)
 
     # Calculate global max for unified scale
-    all_values = []
-    for row in scan_speedup_uffd_vs_sd: all_values.extend(row)
-    for row in harness_speedup_uffd_vs_sd: all_values.extend(row)
-    for row in harness_speedup_uffd_vs_esd: all_values.extend(row)
-    for row in harness_speedup_sd_vs_esd: all_values.extend(row)
-    
-    global_max = max(all_values) if all_values else 1.01
+    matrices = [
+        scan_speedup_uffd_vs_sd,
+        harness_speedup_uffd_vs_sd,
+        harness_speedup_uffd_vs_esd,
+        harness_speedup_sd_vs_esd,
+    ]
+    global_max = float(max((m.max() for m in matrices if m.size), default=1.01))
     if global_max < 1.01: global_max = 1.01
 
+    grids = [
+        (scan_speedup_uffd_vs_sd, "Scan (Uffd over SoftDirty)"),
+        (harness_speedup_uffd_vs_sd, "Harness (Uffd over SoftDirty)"),
+        (harness_speedup_uffd_vs_esd, "Harness (Uffd over ESD)"),
+        (harness_speedup_sd_vs_esd, "Harness (SoftDirty over ESD)"),
+    ]
+    return n_sorted, d_sorted, grids, global_max
+
+def plot_heatmaps(data, output_dir):
+    n_sorted, d_sorted, grids, global_max = compute_speedup_grids(data)
+    # Rows = D, Cols = N
+    rows = len(d_sorted)
+    cols = len(n_sorted)
+
     # Plotting
     fig, axes = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle("Speedup Heatmaps (Green > 1.0x, Red < 1.0x)")
     
-    heatmaps = [
-        (axes[0, 0], scan_speedup_uffd_vs_sd, "Scan (Uffd over SoftDirty)"),
-        (axes[0, 1], harness_speedup_uffd_vs_sd, "Harness (Uffd over SoftDirty)"),
-        (axes[1, 0], harness_speedup_uffd_vs_esd, "Harness (Uffd over ESD)"),
-        (axes[1, 1], harness_speedup_sd_vs_esd, "Harness (SoftDirty over ESD)"),
-    ]
+    heatmaps = [(ax, grid, title) for ax, (grid, title) in zip(axes.flat, grids)]
     
+    # All four heatmaps share one scale
+    norm = mcolors.TwoSlopeNorm(vmin=0, vcenter=1, vmax=global_max)
+    cmap = plt.get_cmap('RdYlGn')
+    annotate = rows * cols <= MAX_ANNOTATED_CELLS
     last_im = None
     for ax, data, title in heatmaps:
-        norm = mcolors.TwoSlopeNorm(vmin=0, vcenter=1, vmax=global_max)
-        
-        im = ax.imshow(data, origin='lower', cmap='RdYlGn', aspect='auto', norm=norm)
+        im = ax.imshow(data, origin='lower', cmap=cmap, aspect='auto', norm=norm)
+        im.set_rasterized(True)
         last_im = im
         ax.set_title(title)
         ax.set_xlabel("N (ops)")
@@ -222,12 +246,13 @@ def plot_heatmaps(data, output_dir):
         ax.set_yticks(range(rows))
         ax.set_yticklabels(d_sorted)
         
-        # Add text annotations
-        for i in range(rows):
-            for j in range(cols):
-                val = data[i][j]
-                text = ax.text(j, i, f"{val:.2f}x",
-                               ha="center", va="center", color="black", fontsize=9)
+        # Add text annotations (skipped on dense grids, where one Text artist per cell
+        # dominates render time and the labels are unreadable anyway)
+        if annotate:
+            for i in range(rows):
+                for j in range(cols):
+                    ax.text(j, i, f"{data[i, j]:.2f}x",
+                            ha="center", va="center", color="black", fontsize=9)
         
     plt.tight_layout()
     
@@ -237,27 +262,87 @@ def plot_heatmaps(data, output_dir):
         fig.colorbar(last_im, cax=cbar_ax, label="Speedup Factor")
 
     filename = os.path.join(output_dir, "speedup_heatmap.png")
-    plt.savefig(filename)
+    plt.savefig(filename, dpi=100)
     print(f"Saved heatmap to {filename}")
     plt.close(fig)
 
+def plot_heatmaps_fast(data, output_dir, cell_px=48):
+    # Paint the same four grids straight into a PNG with Pillow, bypassing matplotlib's
+    # artist/layout machinery. No colorbar, just titled tiles with N/D labels and optional values.
+    n_sorted, d_sorted, grids, global_max = compute_speedup_grids(data)
+    rows = len(d_sorted)
+    cols = len(n_sorted)
+
+    norm = mcolors.TwoSlopeNorm(vmin=0, vcenter=1, vmax=global_max)
+    cmap = plt.get_cmap('RdYlGn')
+    annotate = rows * cols <= MAX_ANNOTATED_CELLS
+
+    # Measure the text up front so labels and titles always fit their tile
+    measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    n_labels = [str(n) for n in n_sorted]
+    d_labels = [str(d) for d in d_sorted]
+    pad = 10
+    title_px = 20
+    label_px = 16
+    cell_w = max([cell_px] + [int(measure.textlength(label)) + 6 for label in n_labels])
+    label_w = max([0] + [int(measure.textlength(label)) for label in d_labels]) + 6
+    title_w = max(int(measure.textlength(title)) for _, title in grids)
+    tile_w = max(label_w + cols * cell_w, title_w)
+    tile_h = title_px + rows * cell_px + label_px
+    canvas = Image.new("RGB", (2 * tile_w + 3 * pad, 2 * tile_h + 3 * pad), "white")
+    draw = ImageDraw.Draw(canvas)
+
+    for k, (grid, title) in enumerate(grids):
+        # Flip so the smallest D ends up at the bottom, as with origin='lower'
+        flipped = np.flipud(grid)
+        rgb = (cmap(norm(flipped))[..., :3] * 255).astype(np.uint8)
+        cells = np.kron(rgb, np.ones((cell_px, cell_w, 1), dtype=np.uint8))
+
+        x0 = pad + (k % 2) * (tile_w + pad)
+        y0 = pad + (k // 2) * (tile_h + pad)
+        grid_x = x0 + label_w
+        grid_y = y0 + title_px
+        draw.text((x0, y0), title, fill="black")
+        canvas.paste(Image.fromarray(cells), (grid_x, grid_y))
+
+        # N along the bottom, D (largest at the top) along the left
+        for j, label in enumerate(n_labels):
+            draw.text((grid_x + j * cell_w + cell_w // 2, grid_y + rows * cell_px + 2), label, fill="black", anchor="ma")
+        for i, label in enumerate(reversed(d_labels)):
+            draw.text((grid_x - 4, grid_y + i * cell_px + cell_px // 2), label, fill="black", anchor="rm")
+
+        if annotate:
+            for i in range(rows):
+                for j in range(cols):
+                    center = (grid_x + j * cell_w + cell_w // 2, grid_y + i * cell_px + cell_px // 2)
+                    draw.text(center, f"{flipped[i, j]:.2f}x", fill="black", anchor="mm")
+
+    # Separate name so the matplotlib heatmap is never overwritten
+    filename = os.path.join(output_dir, "speedup_heatmap_fast.png")
+    canvas.save(filename)
+    print(f"Saved heatmap to {filename}")
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("input_file", help="Input JSON file with benchmark results")
     parser.add_argument("--output-dir", "-o", default="plots", help="Directory to save plots")
+    parser.add_argument("--fast", action="store_true", help="Render the heatmap directly with Pillow to speedup_heatmap_fast.png (no colorbar)")
     args = parser.parse_args()
 
     if not os.path.exists(args.input_file):
         print(f"Error: Input file {args.input_file} not found.", file=sys.stderr)
         sys.exit(1)
 
-    with open(args.input_file, 'r') as f:
-        data = json.load(f)
+    with open(args.input_file, 'rb') as f:
+        data = json_loads(f.read())
 
     os.makedirs(args.output_dir, exist_ok=True)
 
     # Only plot heatmaps
-    plot_heatmaps(data, args.output_dir)
+    if args.fast:
+        plot_heatmaps_fast(data, args.output_dir)
+    else:
+        plot_heatmaps(data, args.output_dir)
 
 if __name__ == "__main__":
     main()
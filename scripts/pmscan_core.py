@@ -0,0 +1,189 @@
+# Shared by pmscan.py and snapshot/benchmark_runner.py: keep this to the standard
+# library (plus optional orjson) so the sweep runner doesn't pick up numpy/numba
+import json
+import sys
+from itertools import chain
+
+# orjson decodes (and encodes) large results considerably faster when available
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':'))
+
+def load_files(paths):
+    # Parse each result file once; returns None (after reporting) if any is unreadable or malformed
+    data_files = []
+    for file_path in paths:
+        try:
+            with open(file_path, 'rb') as f:
+                data = json_loads(f.read())
+        except Exception as e:
+            print(f"Error reading file {file_path}: {e}", file=sys.stderr)
+            return None
+        # Check if it matches the expected structure
+        if isinstance(data, dict) and "strategy" in data and "results" in data:
+            data_files.append(data)
+        else:
+            print(f"Error: File {file_path} does not match expected format (object with 'strategy' and 'results').", file=sys.stderr)
+            return None
+    return data_files
+
+def mean_duration_micros(results, key):
+    # Sum the integer secs/nanos fields in one pass and convert once at the end
+    # (faster than per-run float conversion, and than numpy.fromiter at any run count)
+    if not results:
+        return 0
+    secs = 0
+    nanos = 0
+    for r in results:
+        duration = r.get(key) or {}
+        secs += duration.get("secs", 0)
+        nanos += duration.get("nanos", 0)
+    return ((secs * 1_000_000) + (nanos / 1_000.0)) / len(results)
+
+def extract_page_num(val):
+    if isinstance(val, list):
+        return val[0]
+    return val
+
+def get_dirty_intervals(scan_result):
+    # Sorted (start, end) page intervals, with overlapping/adjacent regions merged
+    intervals = sorted(
+        (extract_page_num(region["start"]), extract_page_num(region["end"]))
+        for region in scan_result.get("regions", [])
+    )
+    merged = []
+    for start, end in intervals:
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+def uncovered_intervals(sup, sub):
+    # Sweep both merged interval lists together, collecting the parts of `sub` not in `sup`
+    missing = []
+    i = 0
+    for start, end in sub:
+        while i < len(sup) and sup[i][1] <= start:
+            i += 1
+        pos = start
+        j = i
+        while pos < end:
+            if j == len(sup) or sup[j][0] >= end:
+                missing.append((pos, end))
+                break
+            if sup[j][0] > pos:
+                missing.append((pos, sup[j][0]))
+            pos = sup[j][1]
+            j += 1
+    return missing
+
+def covers(sup, sub):
+    # Fast yes/no coverage check on merged interval lists; uncovered_intervals gives the details.
+    # True if every sub interval lies inside a single (merged) sup interval.
+    # Plain Python on the tuples: a numba version measured ~2x slower at 10 to 100k regions
+    # (building the int64 arrays costs more than the sweep), plus ~0.26s JIT compile per layout
+    i = 0
+    n = len(sup)
+    for start, end in sub:
+        while i < n and sup[i][1] <= start:
+            i += 1
+        if i == n or sup[i][0] > start or sup[i][1] < end:
+            return False
+    return True
+
+def validate_run(run_idx, uffd_res, emulated_res, soft_dirty_res):
+    # 1. Uffd and EmulatedSoftDirty must be identical
+    # Each pair of scans is compared exactly once, so direct (C-level, early-exit)
+    # equality checks are cheaper than serializing and hashing both sides
+    # (measured ~4.5x faster than sha256 over orjson bytes, ~30x faster than json + blake2b)
+    if uffd_res and emulated_res:
+        uffd_scan = uffd_res["scan"]
+        emulated_scan = emulated_res["scan"]
+        uffd_regions = uffd_scan.get("regions", [])
+        emulated_regions = emulated_scan.get("regions", [])
+        # Compare the scan bounds and region counts before walking the region lists
+        mismatch = None
+        if uffd_scan.get("walk_start") != emulated_scan.get("walk_start") or uffd_scan.get("walk_end") != emulated_scan.get("walk_end"):
+            mismatch = "walk bounds differ"
+        elif len(uffd_regions) != len(emulated_regions):
+            mismatch = f"region counts differ ({len(uffd_regions)} vs {len(emulated_regions)})"
+        elif uffd_regions != emulated_regions:
+            mismatch = "regions differ"
+        if mismatch:
+            print(f"Error: Scan mismatch at run index {run_idx} between Uffd and EmulatedSoftDirty: {mismatch}", file=sys.stderr)
+            # Compact serialization; full scans can be very large
+            uffd_str = json_dumps(uffd_scan)
+            emulated_str = json_dumps(emulated_scan)
+            print(f"  Uffd: {uffd_str}", file=sys.stderr)
+            print(f"  Emulated: {emulated_str}", file=sys.stderr)
+            return False
+
+    # 2. SoftDirty must be a superset of Uffd/Emulated
+    reference_res = uffd_res or emulated_res
+    if soft_dirty_res and reference_res:
+        sd_intervals = get_dirty_intervals(soft_dirty_res["scan"])
+        ref_intervals = get_dirty_intervals(reference_res["scan"])
+
+        if not covers(sd_intervals, ref_intervals):
+            missing = uncovered_intervals(sd_intervals, ref_intervals)
+            # Expand with C-level iteration; the uncovered span can be large
+            missing_pages = list(chain.from_iterable(range(start, end) for start, end in missing))
+            print(f"Error: SoftDirty is NOT a superset of {uffd_res and 'Uffd' or 'EmulatedSoftDirty'} at run index {run_idx}", file=sys.stderr)
+            print(f"  Missing pages in SoftDirty: {missing_pages}", file=sys.stderr)
+            return False
+    return True
+
+def validate_equivalent(data_files):
+    # Check that all files cover the same runs and that every run's scans agree
+    # Validate number of runs
+    first_file = data_files[0]
+    num_runs = len(first_file["results"])
+
+    for data in data_files[1:]:
+        if len(data["results"]) != num_runs:
+            print(f"Error: Files have different number of runs. {first_file['strategy']}: {num_runs}, {data['strategy']}: {len(data['results'])}", file=sys.stderr)
+            return False
+
+    print(f"Number of runs to compare: {num_runs}")
+
+    # Organize data by strategy
+    strategies = {}
+    for data in data_files:
+        strategies[data["strategy"]] = data["results"]
+
+    # Validate scans; strategies with no file are paired with None on every run
+    missing = [None] * num_runs
+    uffd_list = strategies.get("Uffd", missing)
+    emulated_list = strategies.get("EmulatedSoftDirty", missing)
+    soft_dirty_list = strategies.get("SoftDirty", missing)
+    for i, (uffd_res, emulated_res, soft_dirty_res) in enumerate(zip(uffd_list, emulated_list, soft_dirty_list, strict=True)):
+        if not validate_run(i, uffd_res, emulated_res, soft_dirty_res):
+            return False
+    return True
+
+def summarize(data_files):
+    # Print the average scan and harness time per strategy
+    print("-" * 90)
+    print(f"{'Strategy':<30} | {'Avg Scan (µs)':<20} | {'Avg Harness (µs)':<20}")
+    print("-" * 90)
+
+    for data in data_files:
+        strategy = data["strategy"]
+        results = data["results"]
+
+        avg_scan = mean_duration_micros(results, "scan_duration")
+        avg_harness = mean_duration_micros(results, "harness_duration")
+
+        print(f"{strategy:<30} | {avg_scan:<20.2f} | {avg_harness:<20.2f}")
@@ -2,45 +2,38 @@
 import argparse
 import subprocess
 import json
+import math
 import sys
 import os
-import statistics
+import glob
+import importlib.util
 import time
 import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-def extract_page_num(val):
-    if isinstance(val, list):
-        return val[0]
-    return val
-
-def get_dirty_pages(scan_result):
-    pages = set()
-    for region in scan_result.get("regions", []):
-        start = extract_page_num(region["start"])
-        end = extract_page_num(region["end"])
-        for p in range(start, end):
-            pages.add(p)
-    return pages
-
-def validate_run(run_idx, uffd_res, emulated_res, soft_dirty_res):
-    # 1. Uffd and EmulatedSoftDirty must be identical
-    if uffd_res and emulated_res:
-        if uffd_res["scan"] != emulated_res["scan"]:
-            print(f"Error: Scan mismatch at run index {run_idx} between Uffd and EmulatedSoftDirty", file=sys.stderr)
-            return False
-
-    # 2. SoftDirty must be a superset of Uffd/Emulated
-    reference_res = uffd_res or emulated_res
-    if soft_dirty_res and reference_res:
-        sd_pages = get_dirty_pages(soft_dirty_res["scan"])
-        ref_pages = get_dirty_pages(reference_res["scan"])
-        
-        if not sd_pages.issuperset(ref_pages):
-            missing = ref_pages - sd_pages
-            print(f"Error: SoftDirty is NOT a superset of reference at run index {run_idx}", file=sys.stderr)
-            print(f"  Missing pages: {sorted(list(missing))}", file=sys.stderr)
-            return False
-    return True
+# Directory of this script (the snapshot crate); paths to sources and the binary are relative to it
+SNAPSHOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_pmscan_core():
+    # Scan validation is shared with pmscan.py. Load ../scripts/pmscan_core.py by its path
+    # instead of putting scripts/ on sys.path; it only needs the standard library (orjson optional)
+    path = os.path.join(SNAPSHOT_DIR, "..", "scripts", "pmscan_core.py")
+    spec = importlib.util.spec_from_file_location("pmscan_core", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+pmscan_core = load_pmscan_core()
+json_loads = pmscan_core.json_loads
+validate_run = pmscan_core.validate_run
+
+# Runs per invocation in --quick mode
+QUICK_BATCH_RUNS = 5
+# Runs (two batches) before --quick may stop early
+QUICK_MIN_RUNS = 2 * QUICK_BATCH_RUNS
+# Warmup runs for every --quick invocation after the first (each one still maps a fresh region)
+QUICK_REPEAT_WARMUP_RUNS = 1
 
 def parse_duration_micros(duration_obj):
     if not duration_obj:
@@ -49,97 +42,270 @@ def parse_duration_micros(duration_obj):
     nanos = duration_obj.get("nanos", 0)
     return (secs * 1_000_000) + (nanos / 1_000.0)
 
-def run_benchmark(n, d, r, binary_path):
+class OnlineStats:
+    # Welford's single-pass mean/variance accumulator
+    def __init__(self):
+        self.size = 0
+        self._mean = 0.0
+        self.q = 0.0
+
+    def add(self, value):
+        self.size += 1
+        delta = value - self._mean
+        self._mean += delta / self.size
+        self.q += delta * (value - self._mean)
+
+    def mean(self):
+        return self._mean
+
+    def stddev(self):
+        # Sample standard deviation; 0 for fewer than two values
+        if self.size < 2:
+            return 0
+        return math.sqrt(self.q / (self.size - 1))
+
+# Two-sided 95% Student-t quantiles by degrees of freedom; past the table the normal 1.96 applies
+T_QUANTILES_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+    40: 2.021, 60: 2.000, 120: 1.980,
+}
+
+def t_quantile_95(df):
+    # Use the nearest tabulated df at or below the real one, which can only widen the interval
+    if df > max(T_QUANTILES_95):
+        return 1.96
+    return T_QUANTILES_95[max(k for k in T_QUANTILES_95 if k <= df)]
+
+def relative_ci(stats):
+    # Half-width of the 95% confidence interval of the mean (Student t), relative to the mean
+    if stats.size < 2:
+        return math.inf
+    if stats.stddev() == 0:
+        return 0.0
+    return t_quantile_95(stats.size - 1) * stats.stddev() / math.sqrt(stats.size) / abs(stats.mean())
+
+def run_benchmark(n, d, r, binary_path, parallel_strategies=False):
+    return summarize_point(n, d, r, run_strategies(n, d, r, binary_path, parallel_strategies))
+
+def run_adaptive(n, d, max_runs, tol, binary_path, parallel_strategies=False):
+    # Run small batches (each with a fresh seed) until every strategy's scan and harness
+    # means are pinned down to within tol, or max_runs is reached
+    json_map = {}
+    stats = {}
+    runs = 0
+    while runs < max_runs:
+        batch = min(QUICK_BATCH_RUNS, max_runs - runs)
+        # Only the first batch pays the binary's full default warmup
+        warmup_runs = None if runs == 0 else QUICK_REPEAT_WARMUP_RUNS
+        for strat, res_list in run_strategies(n, d, batch, binary_path, parallel_strategies, warmup_runs).items():
+            json_map.setdefault(strat, []).extend(res_list)
+            scan_stats = stats.setdefault((strat, "scan"), OnlineStats())
+            harness_stats = stats.setdefault((strat, "harness"), OnlineStats())
+            for res in res_list:
+                scan_stats.add(parse_duration_micros(res["scan_duration"]))
+                harness_stats.add(parse_duration_micros(res["harness_duration"]))
+        runs += batch
+        # Never stop on the first batch alone: 5 samples say little about the spread
+        if runs >= QUICK_MIN_RUNS and all(relative_ci(s) < tol for s in stats.values()):
+            break
+    print(f"Stopped n={n}, d={d} after {runs} runs")
+    return summarize_point(n, d, runs, json_map)
+
+def run_strategies(n, d, r, binary_path, parallel_strategies=False, warmup_runs=None):
+    # Run every strategy once for r runs; returns the per-run results keyed by strategy.
+    # warmup_runs=None leaves the binary's default warmup in place
     strategies = ["uffd", "soft-dirty", "emulated-soft-dirty"]
-    files = {}
     
     # Generate a random seed for this set of runs so all strategies use the same access pattern
     seed = random.randint(0, 2**64 - 1)
     print(f"Running benchmark for n={n}, d={d}, seed={seed}...")
 
+    cmds = []
     for strat in strategies:
-        outfile = f"{strat}_{n}_{d}.json"
-        cmd = [
+        # "-o -" streams the results over stdout instead of a temporary file
+        cmds.append([
             binary_path,
             "-d", str(d),
             "-n", str(n),
             "-r", str(r),
             "--seed", str(seed),
             strat,
-            "-o", outfile
+            "-o", "-"
+        ] + ([] if warmup_runs is None else ["-w", str(warmup_runs)]))
+
+    # Suppress logging unless error
+    if parallel_strategies:
+        procs = [subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) for cmd in cmds]
+        outputs = [proc.communicate()[0] for proc in procs]
+        for cmd, proc in zip(cmds, procs):
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd)
+    else:
+        outputs = [
+            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+            for cmd in cmds
         ]
-        # Suppress output unless error
-        subprocess.check_call(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        files[strat] = outfile
-
-    # Load and Validate
-    data_map = {}
-    for strat, fname in files.items():
-        with open(fname, 'r') as f:
-            data_map[strat] = json.load(f)
-        os.remove(fname) # Cleanup
-
-    # Normalize keys
+
+    # Load and Validate, keyed by the strategy name the binary reports
+    # Only the per-run results are kept; the rest of each document is dropped right away
     json_map = {}
-    for strat, data in data_map.items():
+    for out in outputs:
+        data = json_loads(out)
         json_map[data["strategy"]] = data["results"]
 
-    # Validate
-    for i in range(r):
-        uffd = json_map.get("Uffd", [None]*r)[i]
-        esd = json_map.get("EmulatedSoftDirty", [None]*r)[i]
-        sd = json_map.get("SoftDirty", [None]*r)[i]
-        
+    return json_map
+
+def run_batch(points, r, binary_path):
+    # Every (n, d, strategy) configuration runs inside one snapshot process, so process
+    # startup is paid once per sweep rather than three times per point
+    strategies = ["Uffd", "SoftDirty", "EmulatedSoftDirty"]
+    configs = []
+    for n, d in points:
+        # Generate a random seed for each point so all strategies use the same access pattern
+        seed = random.randint(0, 2**64 - 1)
+        print(f"Queueing benchmark for n={n}, d={d}, seed={seed}...")
+        for strat in strategies:
+            configs.append({"strategy": strat, "num_ops": n, "stddev": d, "seed": seed, "runs": r})
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as config_file:
+        json.dump(configs, config_file)
+        config_file.flush()
+        print(f"Running {len(configs)} configurations in one batch...")
+        cmd = [binary_path, "--batch-config", config_file.name, "-o", "-"]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+
+    # Entries come back in config order: one per strategy for each point
+    entries = json_loads(out)
+    results = {}
+    for k, (n, d) in enumerate(points):
+        point_entries = entries[k * len(strategies):(k + 1) * len(strategies)]
+        json_map = {entry["strategy"]: entry["results"] for entry in point_entries}
+        results[(n, d)] = summarize_point(n, d, r, json_map)
+    return results
+
+def summarize_point(n, d, r, json_map):
+    # Validate; strategies with no results are paired with None on every run
+    for strat, res_list in json_map.items():
+        if len(res_list) != r:
+            raise RuntimeError(f"{strat} returned {len(res_list)} of {r} runs for n={n}, d={d}")
+    missing = [None] * r
+    uffd_list = json_map.get("Uffd", missing)
+    esd_list = json_map.get("EmulatedSoftDirty", missing)
+    sd_list = json_map.get("SoftDirty", missing)
+    for i, (uffd, esd, sd) in enumerate(zip(uffd_list, esd_list, sd_list, strict=True)):
         if not validate_run(i, uffd, esd, sd):
             raise RuntimeError(f"Validation failed for n={n}, d={d}, run={i}")
 
     # Calculate averages
     results = {}
     for strat, res_list in json_map.items():
-        scan_times = [parse_duration_micros(r["scan_duration"]) for r in res_list]
-        harness_times = [parse_duration_micros(r["harness_duration"]) for r in res_list]
+        scan_stats = OnlineStats()
+        harness_stats = OnlineStats()
+        for res in res_list:
+            scan_stats.add(parse_duration_micros(res["scan_duration"]))
+            harness_stats.add(parse_duration_micros(res["harness_duration"]))
         results[strat] = {
-            "scan_avg": statistics.mean(scan_times),
-            "scan_stdev": statistics.stdev(scan_times) if len(scan_times) > 1 else 0,
-            "harness_avg": statistics.mean(harness_times),
-            "harness_stdev": statistics.stdev(harness_times) if len(harness_times) > 1 else 0,
+            "scan_avg": scan_stats.mean(),
+            "scan_stdev": scan_stats.stddev(),
+            "harness_avg": harness_stats.mean(),
+            "harness_stdev": harness_stats.stddev(),
         }
     
     return results
 
+def binary_up_to_date(binary_path):
+    # A few stats are much cheaper than letting cargo resolve the workspace to find nothing to do.
+    # Sources are found relative to this script, so the check works from any directory
+    if not os.path.exists(binary_path):
+        return False
+    sources = glob.glob(os.path.join(SNAPSHOT_DIR, "src", "**", "*.rs"), recursive=True)
+    if not sources:
+        return False
+    sources += [
+        os.path.join(SNAPSHOT_DIR, "Cargo.toml"),
+        os.path.join(SNAPSHOT_DIR, "..", "Cargo.toml"),
+        os.path.join(SNAPSHOT_DIR, "..", "Cargo.lock"),
+    ]
+    newest = max(os.path.getmtime(src) for src in sources if os.path.exists(src))
+    return os.path.getmtime(binary_path) > newest
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--n", "-n", nargs="+", type=int, required=True, help="List of N values")
     parser.add_argument("--d", "-d", nargs="+", type=float, required=True, help="List of D values")
     parser.add_argument("--runs", "-r", type=int, default=20, help="Number of runs")
     parser.add_argument("--output", "-o", type=str, default="benchmark_results.json", help="Output JSON file")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Number of (n, d) points to run concurrently. Concurrent points compete for cores and "
+                             "memory bandwidth, so keep the default of 1 for publication-quality timings")
+    parser.add_argument("--parallel-strategies", action="store_true",
+                        help="Run the three strategies of each point concurrently (faster, but they interfere with each other's timings)")
+    parser.add_argument("--skip-build", action="store_true", help="Use the existing snapshot binary without invoking cargo")
+    parser.add_argument("--batch", action="store_true",
+                        help="Run every (n, d, strategy) configuration in a single snapshot process (ignores --jobs/--parallel-strategies)")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"Run each point in batches of {QUICK_BATCH_RUNS} (at least {QUICK_MIN_RUNS} runs) until every mean's "
+                             "95%% Student-t confidence interval is within --tolerance of it, up to --max-runs")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Relative confidence interval half-width for --quick")
+    parser.add_argument("--max-runs", type=int, default=None, help="Upper bound on runs per point for --quick (default: --runs)")
     args = parser.parse_args()
 
+    if args.quick and args.batch:
+        parser.error("--quick cannot be combined with --batch")
+    if args.max_runs is None:
+        args.max_runs = args.runs
+
     # Build
-    print("Building snapshot binary...")
-    subprocess.check_call(["cargo", "build", "--release", "--bin", "snapshot"])
-    binary_path = "../target/release/snapshot"
+    binary_path = os.path.join(SNAPSHOT_DIR, "..", "target", "release", "snapshot")
+    if args.skip_build:
+        print("Skipping build of snapshot binary")
+    elif binary_up_to_date(binary_path):
+        print("Snapshot binary is up to date, skipping build")
+    else:
+        print("Building snapshot binary...")
+        subprocess.check_call(["cargo", "build", "--release", "--bin", "snapshot"], cwd=SNAPSHOT_DIR)
 
+    points = [(n, d) for n in args.n for d in args.d]
     all_results = {}
+
+    if args.batch:
+        try:
+            all_results = run_batch(points, args.runs, binary_path)
+        except Exception as e:
+            print(f"Batch benchmark failed: {e}")
+            sys.exit(1)
+    else:
+        # Each (n, d) point is independent; results are collected in submission order
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+            if args.quick:
+                futures = [
+                    ((n, d), executor.submit(run_adaptive, n, d, args.max_runs, args.tolerance, binary_path, args.parallel_strategies))
+                    for n, d in points
+                ]
+            else:
+                futures = [
+                    ((n, d), executor.submit(run_benchmark, n, d, args.runs, binary_path, args.parallel_strategies))
+                    for n, d in points
+                ]
+            failed = False
+            for (n, d), future in futures:
+                try:
+                    all_results[(n, d)] = future.result()
+                except Exception as e:
+                    print(f"Benchmark failed for n={n}, d={d}: {e}")
+                    # Queued points are skipped; points already running are allowed to finish
+                    # (their snapshot processes aren't interrupted) before the pool exits
+                    for _, other in futures:
+                        other.cancel()
+                    failed = True
+                    break
+        if failed:
+            sys.exit(1)
+
     # Structure for JSON output: list of objects with n, d, results
-    output_data = []
-
-    for n in args.n:
-        for d in args.d:
-            try:
-                res = run_benchmark(n, d, args.runs, binary_path)
-                # Convert tuple key to string for JSON compatibility if needed, 
-                # but better to structure as list of objects
-                entry = {
-                    "n": n,
-                    "d": d,
-                    "results": res
-                }
-                output_data.append(entry)
-                all_results[(n, d)] = res
-            except Exception as e:
-                print(f"Benchmark failed for n={n}, d={d}: {e}")
-                sys.exit(1)
+    output_data = [{"n": n, "d": d, "results": res} for (n, d), res in all_results.items()]
 
     # Print Summary Table
     print("\nSummary Results (Avg µs):")
@@ -6,10 +6,10 @@ use nix::sys::mman::{MapFlags, ProtFlags, mmap_anonymous, mprotect, munmap};
 use rand::prelude::*;
 use rand::{Rng, rngs::StdRng};
 use rand_distr::{Distribution, Normal};
-use serde::Serialize;
+use serde::{Deserialize, Serialize};
 use std::cmp::min;
 use std::fs::File;
-use std::io::BufWriter;
+use std::io::{BufReader, BufWriter, Write};
 use std::ops::Range;
 use std::sync::LazyLock;
 use std::time::{Duration, Instant};
@@ -24,8 +24,10 @@ mod jit;
 use jit::{JitCompiler, JittedFn};
 
 const MB: usize = 1024 * 1024;
+/// Address space reserved for each benchmark region (only `size` bytes of it are made accessible)
+const RESERVATION_SIZE: usize = 1usize << 33;
 
-#[derive(Copy, Clone, Debug, PartialEq, Eq, ValueEnum, Serialize)]
+#[derive(Copy, Clone, Debug, PartialEq, Eq, ValueEnum, Serialize, Deserialize)]
 enum DirtyTrackingStrategy {
     SoftDirty,
     Uffd,
@@ -53,11 +55,17 @@ struct CLI {
     /// These do not show up in the final stats
     #[arg(short, long, default_value_t = 3)]
     pub warmup_runs: u32,
-    /// Output file to write timing results to
+    /// Output file to write timing results to (`-` for compact JSON on stdout)
     #[arg(short, long)]
     pub output: Option<String>,
-    #[arg(value_enum)]
-    pub strategy: DirtyTrackingStrategy,
+    /// JSON file listing configurations (`strategy`, `num_ops`, `stddev`, `seed`, `runs`)
+    /// to run back-to-back in this process instead of a single strategy.
+    ///
+    /// The output is then a list with one entry per configuration
+    #[arg(long, conflicts_with = "strategy")]
+    pub batch_config: Option<String>,
+    #[arg(value_enum, required_unless_present = "batch_config")]
+    pub strategy: Option<DirtyTrackingStrategy>,
 }
 
 struct SoftDirtyBitmap(pub Vec<u8>);
@@ -285,46 +293,55 @@ fn uffd_benchmark(
     })
 }
 
-fn main() -> Result<()> {
-    env_logger::init();
-    log::debug!("Page size: {} bytes", page_size());
-
-    let cli = CLI::parse();
-
-    // Open the pagemap and clear_refs files
-    LazyLock::force(&PAGEMAP_FILE);
-    LazyLock::force(&CLEAR_REFS_FILE);
+/// A single benchmark configuration. The CLI describes one directly; `--batch-config`
+/// supplies a list of them to run in a single process.
+#[derive(Clone, Deserialize, Serialize)]
+struct BenchConfig {
+    strategy: DirtyTrackingStrategy,
+    num_ops: u32,
+    stddev: Option<f64>,
+    seed: u64,
+    runs: u32,
+}
 
+/// Run one configuration on a freshly mapped region, returning the non-warmup results
+fn run_benchmark(
+    config: &BenchConfig,
+    size: usize,
+    warmup_runs: u32,
+    verbose: bool,
+) -> Result<Vec<ResultStat>> {
     // mmap the memory
     let ptr = unsafe {
         // 8GB Address
         let ptr = mmap_anonymous(
             None,
-            NonZeroUsize::new(1usize << 33).unwrap(),
+            NonZeroUsize::new(RESERVATION_SIZE).unwrap(),
             ProtFlags::PROT_NONE | ProtFlags::PROT_WRITE,
             MapFlags::MAP_PRIVATE,
         )?;
-        mprotect(ptr, cli.size, ProtFlags::PROT_READ | ProtFlags::PROT_WRITE)?;
+        mprotect(ptr, size, ProtFlags::PROT_READ | ProtFlags::PROT_WRITE)?;
         ptr
     };
-    log::info!("Mapped {} bytes at {:p}", cli.size, ptr);
-    let normal = Normal::new(0.0, cli.stddev.unwrap_or((cli.size >> 15) as f64))?;
+    log::info!("Mapped {} bytes at {:p}", size, ptr);
+    let normal = Normal::new(0.0, config.stddev.unwrap_or((size >> 15) as f64))?;
     log::info!("Using {:?} for random walk", normal);
 
     // Create a slice from the raw parts
-    let slice = unsafe { std::slice::from_raw_parts_mut(ptr.cast::<u8>().as_ptr(), cli.size) };
+    let slice = unsafe { std::slice::from_raw_parts_mut(ptr.cast::<u8>().as_ptr(), size) };
     // Initialize with random data using a seeded RNG
-    let mut srng = StdRng::seed_from_u64(cli.seed);
+    let mut srng = StdRng::seed_from_u64(config.seed);
 
-    let mut run_call = |s: &mut [u8]| run_harness(s, cli.num_ops, normal, &mut srng);
-    let total_runs = cli.runs + cli.warmup_runs;
-    let results = match cli.strategy {
+    let num_ops = config.num_ops;
+    let mut run_call = |s: &mut [u8]| run_harness(s, num_ops, normal, &mut srng);
+    let total_runs = config.runs + warmup_runs;
+    let results = match config.strategy {
         DirtyTrackingStrategy::EmulatedSoftDirty => (0..total_runs)
             .enumerate()
             .map(|(i, _)| {
                 log::info!("Starting Emulated Soft-Dirty run {i}...");
                 let (harness_duration, bitmap) =
-                    run_harness_emulated_dirty(slice, cli.num_ops, normal, &mut srng)?;
+                    run_harness_emulated_dirty(slice, num_ops, normal, &mut srng)?;
                 Ok(ResultStat {
                     scan: PageMapScanResult::from_bitmap(bitmap, Categories::empty()),
                     scan_duration: Duration::ZERO,
@@ -337,7 +354,7 @@ fn main() -> Result<()> {
             .enumerate()
             .map(|(i, _)| {
                 log::info!("Starting Soft-Dirty run {i}...");
-                soft_dirty_benchmark(slice, &mut run_call, cli.verbose)
+                soft_dirty_benchmark(slice, &mut run_call, verbose)
             })
             .collect::<Result<Vec<_>>>()?,
 
@@ -373,13 +390,89 @@ fn main() -> Result<()> {
                 .enumerate()
                 .map(|(i, _)| {
                     log::info!("Starting UFFD run {i}...");
-                    uffd_benchmark(slice, &mut run_call, cli.verbose)
+                    uffd_benchmark(slice, &mut run_call, verbose)
                 })
                 .collect::<Result<Vec<_>>>()?
+            // `uffd` is dropped (and the range unregistered) here, before the unmap
         }
     };
 
-    if let Some(output_file) = cli.output {
+    log::info!("Completed, cleaning up...");
+    // Clean up the whole reservation, not just the accessible part, so batch mode
+    // doesn't accumulate mappings across configurations
+    unsafe {
+        munmap(ptr, RESERVATION_SIZE)?;
+    }
+
+    Ok(results[warmup_runs as usize..].to_vec())
+}
+
+/// Write `value` as JSON to `output_file`, or compactly to stdout if it is `-`
+fn write_output<T: Serialize>(output_file: &str, value: &T) -> Result<()> {
+    // Flush explicitly: dropping a BufWriter would silently discard a failed final write
+    if output_file == "-" {
+        let mut writer = BufWriter::new(std::io::stdout().lock());
+        serde_json::to_writer(&mut writer, value)?;
+        writer.flush()?;
+    } else {
+        let mut writer = BufWriter::new(File::create(output_file)?);
+        serde_json::to_writer_pretty(&mut writer, value)?;
+        writer.flush()?;
+    }
+    Ok(())
+}
+
+fn main() -> Result<()> {
+    env_logger::init();
+    log::debug!("Page size: {} bytes", page_size());
+
+    let cli = CLI::parse();
+
+    // Open the pagemap and clear_refs files
+    LazyLock::force(&PAGEMAP_FILE);
+    LazyLock::force(&CLEAR_REFS_FILE);
+
+    if let Some(batch_config) = &cli.batch_config {
+        let configs: Vec<BenchConfig> =
+            serde_json::from_reader(BufReader::new(File::open(batch_config)?))?;
+
+        #[derive(Serialize)]
+        struct BatchEntry {
+            #[serde(flatten)]
+            config: BenchConfig,
+            results: Vec<ResultStat>,
+        }
+
+        let entries = configs
+            .into_iter()
+            .enumerate()
+            .map(|(i, config)| {
+                log::info!(
+                    "Starting batch configuration {i} ({:?})...",
+                    config.strategy
+                );
+                let results = run_benchmark(&config, cli.size, cli.warmup_runs, cli.verbose)?;
+                Ok(BatchEntry { config, results })
+            })
+            .collect::<Result<Vec<_>>>()?;
+
+        if let Some(output_file) = &cli.output {
+            write_output(output_file, &entries)?;
+        }
+        return Ok(());
+    }
+
+    // Clap guarantees a strategy whenever there is no batch config
+    let config = BenchConfig {
+        strategy: cli.strategy.unwrap(),
+        num_ops: cli.num_ops,
+        stddev: cli.stddev,
+        seed: cli.seed,
+        runs: cli.runs,
+    };
+    let results = run_benchmark(&config, cli.size, cli.warmup_runs, cli.verbose)?;
+
+    if let Some(output_file) = &cli.output {
         #[derive(Serialize)]
         struct BenchmarkOutput {
             strategy: DirtyTrackingStrategy,
@@ -387,15 +480,10 @@ fn main() -> Result<()> {
         }
 
         let output = BenchmarkOutput {
-            strategy: cli.strategy,
-            results: results[cli.warmup_runs as usize..].to_vec(),
+            strategy: config.strategy,
+            results,
         };
-        serde_json::to_writer_pretty(BufWriter::new(File::create(output_file)?), &output)?;
-    }
-    log::info!("Completed, cleaning up...");
-    // Clean up
-    unsafe {
-        munmap(ptr, cli.size)?;
+        write_output(output_file, &output)?;
     }
 
     Ok(())
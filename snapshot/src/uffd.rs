@@ -17,7 +17,19 @@ impl FromRawFd for Uffd {
 
 impl IntoRawFd for Uffd {
     fn into_raw_fd(self) -> RawFd {
-        self.0
+        // Ownership of the fd moves to the caller, so skip our `Drop`
+        let fd = self.0;
+        std::mem::forget(self);
+        fd
+    }
+}
+
+impl Drop for Uffd {
+    fn drop(&mut self) {
+        // Closing the userfaultfd also unregisters any ranges registered with it
+        unsafe {
+            libc::close(self.0);
+        }
     }
 }
 